@@ -1,221 +1,561 @@
 import streamlit as st
+import pandas as pd
 import sqlite3
 import os
-import time
+import uuid
+import queue
+import shutil
+import tempfile
+from contextlib import contextmanager
 from PIL import Image
 import hashlib
+import hmac
+import html
+import base64
+import mimetypes
 
 # --- CONFIG ---
 DB_NAME = "objects.db"
 IMAGES_DIR = "images"
-os.makedirs(IMAGES_DIR, exist_ok=True)
+THUMBS_DIR = os.path.join(IMAGES_DIR, "thumbs")
+THUMB_WIDTHS = (200, 150)
+POOL_SIZE = 5
+FETCH_SIZE = 64
+PAGE_SIZE = 50
+COPY_CHUNK_SIZE = 1024 * 1024
+# scrypt cost: 2**15 * 8 * 128 bytes = 32 MB per hash, roughly 100 ms
+SCRYPT_N = 2 ** 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+
+# --- SQL ---
+# Hot statements are kept as constants so every call passes the identical
+# string and hits the per-connection sqlite3 statement cache.
+
+SQL_GET_PLACES = "SELECT id, name FROM places ORDER BY name"
+
+SQL_INSERT_PLACE = '''
+    INSERT INTO places (name) VALUES (?)
+    ON CONFLICT(name) DO UPDATE SET name = excluded.name
+    RETURNING id
+'''
+
+SQL_INSERT_OBJECT = '''
+    INSERT INTO objects (client_name, car_number, place_id, image_path)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT DO NOTHING
+    RETURNING id
+'''
+
+SQL_SEARCH_CLIENT = '''
+    SELECT o.client_name, o.car_number, p.name, o.image_path
+    FROM objects_fts f
+    JOIN objects o ON o.id = f.rowid
+    JOIN places p ON o.place_id = p.id
+    WHERE objects_fts MATCH ?
+    ORDER BY o.id
+'''
+
+SQL_SEARCH_CLIENT_LIKE = '''
+    SELECT o.client_name, o.car_number, p.name, o.image_path
+    FROM objects o
+    JOIN places p ON o.place_id = p.id
+    WHERE o.client_name LIKE ? ESCAPE '\\' OR o.car_number LIKE ? ESCAPE '\\'
+'''
+
+SQL_SEARCH_PLACE = '''
+    SELECT o.client_name, o.car_number, o.image_path
+    FROM objects o
+    JOIN places p ON o.place_id = p.id
+    WHERE p.name LIKE ? ESCAPE '\\'
+'''
+
+SQL_GET_FIRST_PAGE = '''
+    SELECT o.id, o.client_name, o.car_number, p.name
+    FROM objects o
+    JOIN places p ON o.place_id = p.id
+    ORDER BY o.client_name, o.id
+    LIMIT ?
+'''
+
+SQL_GET_NEXT_PAGE = '''
+    SELECT o.id, o.client_name, o.car_number, p.name
+    FROM objects o
+    JOIN places p ON o.place_id = p.id
+    WHERE (o.client_name, o.id) > (?, ?)
+    ORDER BY o.client_name, o.id
+    LIMIT ?
+'''
+
+# --- DB CONNECTION POOL ---
+
+
+def _new_connection():
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False,
+                           isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    # Kept in cache_resource so script reruns reuse the same warm connections
+    pool = queue.Queue(maxsize=POOL_SIZE)
+    for _ in range(POOL_SIZE):
+        pool.put(_new_connection())
+    return pool
+
+
+@contextmanager
+def db():
+    pool = get_pool()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+
+@contextmanager
+def transaction():
+    # Pool connections autocommit; group multi-statement writes explicitly
+    with db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            # The body may already have rolled back, e.g. add_entry
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        if conn.in_transaction:
+            conn.execute("COMMIT")
+
+
+def like_pattern(term):
+    # Match the term literally, even if it contains % or _
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def iter_rows(cursor):
+    # Stream rows in small batches instead of materializing fetchall()
+    while rows := cursor.fetchmany(FETCH_SIZE):
+        yield from rows
+
+# --- PASSWORD HASHING ---
+
+
+def hash_password(password, salt=None):
+    if salt is None:
+        salt = os.urandom(SALT_SIZE)
+    key = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R,
+                         p=SCRYPT_P, maxmem=64 * 1024 * 1024, dklen=32)
+    # Stored as hex(salt || key)
+    return (salt + key).hex()
+
+
+def verify_password(password, stored_hash):
+    if not stored_hash:
+        return False
+    if len(stored_hash) == 64:
+        # Legacy unsalted SHA-256 hash from before the scrypt switch
+        legacy_hash = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, stored_hash)
+    salt = bytes.fromhex(stored_hash[:SALT_SIZE * 2])
+    return hmac.compare_digest(hash_password(password, salt), stored_hash)
+
+# --- IMAGE STORAGE ---
+
+
+@st.cache_resource(show_spinner=False)
+def get_umask():
+    # os.umask can only be read by setting it, so do that once per process
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+@contextmanager
+def atomic_write(path):
+    # Write to a temp file beside path and rename it into place, so path
+    # only ever names a complete file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        # mkstemp creates 0600 files; give them the usual open() mode
+        os.chmod(tmp_path, 0o666 & ~get_umask())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def content_hash(image_file):
+    # BLAKE2b is faster than SHA-256 in software and fine for dedup keys
+    h = hashlib.blake2b(digest_size=16)
+    while chunk := image_file.read(COPY_CHUNK_SIZE):
+        h.update(chunk)
+    image_file.seek(0)
+    return h.hexdigest()
+
+
+def thumbnail_path(image_path, width):
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(THUMBS_DIR, f"{stem}_{width}.jpg")
+
+
+def make_thumbnails(image_path):
+    with Image.open(image_path) as im:
+        im = im.convert("RGB")
+        for width in THUMB_WIDTHS:
+            thumb = im.copy()
+            # Bound the width only so the aspect ratio matches st.image(width=...)
+            thumb.thumbnail((width, im.height), Image.Resampling.LANCZOS)
+            with atomic_write(thumbnail_path(image_path, width)) as f:
+                thumb.save(f, "JPEG", quality=82, optimize=True)
+
+
+def list_images():
+    # One directory read per search instead of a stat() per result row
+    return set(os.listdir(IMAGES_DIR))
+
+
+@st.cache_resource(show_spinner=False)
+def get_thumbnail(image_path, width):
+    thumb_path = thumbnail_path(image_path, width)
+    if not os.path.exists(thumb_path):
+        # Images uploaded before thumbnails existed get them on first view.
+        # Failures raise OSError, which cache_resource doesn't cache
+        make_thumbnails(image_path)
+    return thumb_path
+
+
+@st.cache_data(show_spinner=False, max_entries=200)
+def thumbnail_data_url(image_path, width):
+    # Inlined into the search results HTML so they render as one element
+    thumb_path = get_thumbnail(image_path, width)
+    mime = mimetypes.guess_type(thumb_path)[0] or "image/jpeg"
+    with open(thumb_path, "rb") as f:
+        data = base64.b64encode(f.read()).decode()
+    return f"data:{mime};base64,{data}"
+
+
+def thumbnail_img(image_path, width):
+    try:
+        src = thumbnail_data_url(image_path, width)
+    except OSError:
+        # No thumbnail could be made; skip it rather than inlining the
+        # full-size original
+        return None
+    return f'<img src="{src}" width="{width}">'
 
 # --- DB SETUP ---
 
 
+@st.cache_resource(show_spinner=False)
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-
-    # Create places and objects tables
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS places (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS objects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_name TEXT NOT NULL,
-            car_number TEXT NOT NULL,
-            place_id INTEGER NOT NULL,
-            image_path TEXT,
-            FOREIGN KEY (place_id) REFERENCES places(id)
-        )
-    ''')
-
-    # Create settings table to store hashed password
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )
-    ''')
-
-    # Insert default password hash if not set yet (default: "admin123")
-    c.execute("SELECT value FROM settings WHERE key = 'admin_password'")
-    if c.fetchone() is None:
-        default_password = "admin123"
-        hashed_pw = hashlib.sha256(default_password.encode()).hexdigest()
-        c.execute("INSERT INTO settings (key, value) VALUES (?, ?)",
-                  ('admin_password', hashed_pw))
-
-    conn.commit()
-    conn.close()
+    # Cached so schema setup runs once per process, not on every rerun
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    os.makedirs(THUMBS_DIR, exist_ok=True)
+
+    with db() as conn:
+        c = conn.cursor()
+
+        # Create places and objects tables
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS places (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS objects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_name TEXT NOT NULL,
+                car_number TEXT NOT NULL,
+                place_id INTEGER NOT NULL,
+                image_path TEXT,
+                FOREIGN KEY (place_id) REFERENCES places(id)
+            )
+        ''')
+
+        # Create settings table to store hashed password
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+
+        # Insert default password hash if not set yet (default: "admin123")
+        c.execute("SELECT value FROM settings WHERE key = 'admin_password'")
+        if c.fetchone() is None:
+            default_password = "admin123"
+            hashed_pw = hash_password(default_password)
+            c.execute("INSERT INTO settings (key, value) VALUES (?, ?)",
+                      ('admin_password', hashed_pw))
+
+        # One entry per client/car pair, enforced so add_entry can upsert.
+        # Databases from before the unique index may hold duplicate pairs:
+        # the first time through, move every row but the oldest of each
+        # pair into objects_duplicates (nothing is discarded), then index
+        c.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'idx_objects_client_car'")
+        if c.fetchone() is None:
+            with transaction() as migration:
+                m = migration.cursor()
+                m.execute('''
+                    CREATE TABLE IF NOT EXISTS objects_duplicates
+                    AS SELECT * FROM objects WHERE 0
+                ''')
+                m.execute('''
+                    INSERT INTO objects_duplicates
+                    SELECT * FROM objects
+                    WHERE id NOT IN (
+                        SELECT MIN(id) FROM objects
+                        GROUP BY client_name, car_number
+                    )
+                ''')
+                m.execute('''
+                    DELETE FROM objects
+                    WHERE id IN (SELECT id FROM objects_duplicates)
+                ''')
+                m.execute('''
+                    CREATE UNIQUE INDEX idx_objects_client_car
+                    ON objects (client_name, car_number)
+                ''')
+
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_objects_place ON objects (place_id)")
+        # (client_name, rowid) order for keyset pagination in Manage Entries
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_objects_client ON objects (client_name)")
+
+        # Trigram full-text index so substring search doesn't scan objects
+        c.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'objects_fts'")
+        fts_exists = c.fetchone() is not None
+        c.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS objects_fts USING fts5(
+                client_name, car_number,
+                content='objects', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS objects_fts_insert AFTER INSERT ON objects
+            BEGIN
+                INSERT INTO objects_fts (rowid, client_name, car_number)
+                VALUES (new.id, new.client_name, new.car_number);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS objects_fts_delete AFTER DELETE ON objects
+            BEGIN
+                INSERT INTO objects_fts (objects_fts, rowid, client_name, car_number)
+                VALUES ('delete', old.id, old.client_name, old.car_number);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS objects_fts_update AFTER UPDATE ON objects
+            BEGIN
+                INSERT INTO objects_fts (objects_fts, rowid, client_name, car_number)
+                VALUES ('delete', old.id, old.client_name, old.car_number);
+                INSERT INTO objects_fts (rowid, client_name, car_number)
+                VALUES (new.id, new.client_name, new.car_number);
+            END
+        ''')
+        if not fts_exists:
+            # Index rows that were added before the FTS table existed
+            c.execute("INSERT INTO objects_fts (objects_fts) VALUES ('rebuild')")
 
 
 init_db()
 
+# --- CACHE VERSIONS ---
+
+
+@st.cache_resource(show_spinner=False)
+def get_data_versions():
+    # Shared by all sessions so one admin's edits invalidate everyone's cache
+    return {"places": 0, "entries": 0, "password": 0}
+
+
+def bump_version(name):
+    get_data_versions()[name] += 1
+
 # --- DB FUNCTIONS ---
 
 
-def get_password_hash():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key = 'admin_password'")
-    row = c.fetchone()
-    conn.close()
+@st.cache_data(show_spinner=False, max_entries=2)
+def _load_password_hash(version):
+    with db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT value FROM settings WHERE key = 'admin_password'")
+        row = c.fetchone()
     return row[0] if row else None
 
 
+def get_password_hash():
+    return _load_password_hash(get_data_versions()["password"])
+
+
 def check_password(entered_password):
     stored_hash = get_password_hash()
-    entered_hash = hashlib.sha256(entered_password.encode()).hexdigest()
-    return entered_hash == stored_hash
+    if stored_hash is None:
+        # Nothing to compare against; skip the KDF work entirely
+        return False
+    if not verify_password(entered_password, stored_hash):
+        return False
+    if len(stored_hash) == 64:
+        # Re-hash legacy SHA-256 passwords with scrypt on first good login
+        update_admin_password(entered_password)
+    return True
 
 
 def update_admin_password(new_password):
-    new_hash = hashlib.sha256(new_password.encode()).hexdigest()
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
-        "UPDATE settings SET value = ? WHERE key = 'admin_password'", (new_hash,))
-    conn.commit()
-    conn.close()
+    new_hash = hash_password(new_password)
+    with db() as conn:
+        c = conn.cursor()
+        c.execute(
+            "UPDATE settings SET value = ? WHERE key = 'admin_password'", (new_hash,))
+    bump_version("password")
 
 
-def get_places():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, name FROM places ORDER BY name")
-    places = c.fetchall()
-    conn.close()
+# Versions only go up, so keep just the latest couple of snapshots
+@st.cache_data(show_spinner=False, max_entries=2)
+def _load_places(version):
+    with db() as conn:
+        c = conn.cursor()
+        c.execute(SQL_GET_PLACES)
+        places = c.fetchall()
     return places
 
 
-def add_place(name):
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT INTO places (name) VALUES (?)", (name.strip(),))
-        conn.commit()
-        conn.close()
-    except sqlite3.IntegrityError:
-        pass
-
-
-def delete_place(place_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # Check if any objects use this place
-    c.execute("SELECT COUNT(*) FROM objects WHERE place_id = ?", (place_id,))
-    count = c.fetchone()[0]
-    if count == 0:
-        c.execute("DELETE FROM places WHERE id = ?", (place_id,))
-        conn.commit()
-        deleted = True
-    else:
-        deleted = False
-    conn.close()
-    return deleted
+def get_places():
+    return _load_places(get_data_versions()["places"])
 
 
-def get_place_id_by_name(name):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id FROM places WHERE name = ?", (name,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else None
+def add_place(name):
+    # Returns the id of the new or already existing place in one statement
+    with db() as conn:
+        c = conn.cursor()
+        c.execute(SQL_INSERT_PLACE, (name.strip(),))
+        place_id = c.fetchone()[0]
+    bump_version("places")
+    return place_id
 
 
-def object_exists(client_name, car_number):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM objects WHERE client_name = ? AND car_number = ?",
-              (client_name, car_number))
-    exists = c.fetchone() is not None
-    conn.close()
-    return exists
+def delete_places(place_ids):
+    # Returns the ids actually deleted; places still in use are kept
+    deleted = []
+    with transaction() as conn:
+        c = conn.cursor()
+        for place_id in place_ids:
+            # Check if any objects use this place
+            c.execute(
+                "SELECT COUNT(*) FROM objects WHERE place_id = ?", (place_id,))
+            if c.fetchone()[0] == 0:
+                c.execute("DELETE FROM places WHERE id = ?", (place_id,))
+                deleted.append(place_id)
+    if deleted:
+        bump_version("places")
+    return deleted
 
 
-def add_object(client_name, car_number, place_id, image_file):
+def add_entry(client_name, car_number, place_name, image_file):
     image_path = None
     if image_file:
-        ext = os.path.splitext(image_file.name)[1]
-        timestamp = int(time.time())
-        sanitized_name = client_name.replace(" ", "_")
-        filename = f"{sanitized_name}_{timestamp}{ext}"
+        # Content-addressed name, so re-uploading the same photo is stored once
+        ext = os.path.splitext(image_file.name)[1].lower()
+        filename = f"{content_hash(image_file)}{ext}"
         image_path = os.path.join(IMAGES_DIR, filename)
-        with open(image_path, "wb") as f:
-            f.write(image_file.read())
 
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO objects (client_name, car_number, place_id, image_path) VALUES (?, ?, ?, ?)",
-              (client_name, car_number, place_id, image_path))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute(SQL_INSERT_PLACE, (place_name.strip(),))
+        place_id = c.fetchone()[0]
+        c.execute(SQL_INSERT_OBJECT,
+                  (client_name, car_number, place_id, image_path))
+        row = c.fetchone()
+        if row is None:
+            # This client already has that car number registered; don't
+            # keep a new place created just for this entry either
+            conn.rollback()
+            return None
+
+    if image_path and not os.path.exists(image_path):
+        with atomic_write(image_path) as f:
+            shutil.copyfileobj(image_file, f, length=COPY_CHUNK_SIZE)
+        try:
+            make_thumbnails(image_path)
+        except OSError:
+            # Not decodable by Pillow; search falls back to the original
+            pass
+    bump_version("places")
+    bump_version("entries")
+    return row[0]
 
 
 def search_by_client_or_car(term):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        SELECT o.client_name, o.car_number, p.name, o.image_path
-        FROM objects o
-        JOIN places p ON o.place_id = p.id
-        WHERE o.client_name LIKE ? OR o.car_number LIKE ?
-    ''', (f"%{term}%", f"%{term}%"))
-    results = c.fetchall()
-    conn.close()
-    return results
+    term = term.strip()
+    if not term:
+        # Empty search would match and render every row
+        return
+    with db() as conn:
+        c = conn.cursor()
+        if len(term) >= 3:
+            # Trigram index only matches terms of three or more characters
+            c.execute(SQL_SEARCH_CLIENT, ('"' + term.replace('"', '""') + '"',))
+        else:
+            pattern = like_pattern(term)
+            c.execute(SQL_SEARCH_CLIENT_LIKE, (pattern, pattern))
+        yield from iter_rows(c)
 
 
 def search_by_place_name(place_name):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        SELECT o.client_name, o.car_number, o.image_path
-        FROM objects o
-        JOIN places p ON o.place_id = p.id
-        WHERE p.name LIKE ?
-    ''', (f"%{place_name}%",))
-    results = c.fetchall()
-    conn.close()
-    return results
-
-
-def get_all_objects():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        SELECT o.id, o.client_name, o.car_number, p.name
-        FROM objects o
-        JOIN places p ON o.place_id = p.id
-        ORDER BY o.client_name
-    ''')
-    rows = c.fetchall()
-    conn.close()
-    return rows
-
-
-def update_car_number(object_id, new_number):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE objects SET car_number = ? WHERE id = ?",
-              (new_number, object_id))
-    conn.commit()
-    conn.close()
-
-
-def delete_object(object_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM objects WHERE id = ?", (object_id,))
-    conn.commit()
-    conn.close()
+    place_name = place_name.strip()
+    if not place_name:
+        return
+    with db() as conn:
+        c = conn.cursor()
+        c.execute(SQL_SEARCH_PLACE, (like_pattern(place_name),))
+        yield from iter_rows(c)
+
+
+@st.cache_data(show_spinner=False, max_entries=20)
+def _load_objects_page(version, after, limit):
+    with db() as conn:
+        c = conn.cursor()
+        # One extra row tells us whether a next page exists
+        if after is None:
+            c.execute(SQL_GET_FIRST_PAGE, (limit + 1,))
+        else:
+            c.execute(SQL_GET_NEXT_PAGE, (*after, limit + 1))
+        rows = c.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def get_objects_page(after=None, limit=PAGE_SIZE):
+    # Keyset pagination: after is the (client_name, id) of the previous
+    # page's last row, so each page is an index seek rather than an OFFSET
+    return _load_objects_page(get_data_versions()["entries"], after, limit)
+
+
+def save_entry_changes(updates, deleted_ids):
+    # updates is a list of (new_number, object_id); applied in one batch
+    with transaction() as conn:
+        c = conn.cursor()
+        c.executemany("UPDATE objects SET car_number = ? WHERE id = ?",
+                      updates)
+        c.executemany("DELETE FROM objects WHERE id = ?",
+                      [(object_id,) for object_id in deleted_ids])
+    bump_version("entries")
 
 
 # --- STREAMLIT APP ---
@@ -259,25 +599,44 @@ with tab1:
     if search_type == "Client/Car Number":
         term = st.text_input("Enter client name or car number")
         if st.button("Search"):
-            results = search_by_client_or_car(term)
-            if results:
-                for i, (client_name, car_number, place, image_path) in enumerate(results, 1):
-                    st.subheader(f"{i}. {client_name} — {car_number}")
-                    st.caption(f"\U0001F4CD {place}")
-                    if image_path and os.path.exists(image_path):
-                        st.image(image_path, width=200)
+            existing_images = list_images()
+            # Read all rows first so no pooled connection is held while
+            # thumbnails are built
+            rows = list(search_by_client_or_car(term))
+            # Build all results as one HTML block: one element instead of
+            # a subheader, caption and image per row
+            parts = []
+            for i, (client_name, car_number, place, image_path) in enumerate(rows, 1):
+                parts.append(
+                    f"<h3>{i}. {html.escape(client_name)} — {html.escape(car_number)}</h3>")
+                parts.append(
+                    f'<p style="font-size: 14px; opacity: 0.6">\U0001F4CD {html.escape(place)}</p>')
+                if image_path and os.path.basename(image_path) in existing_images:
+                    img = thumbnail_img(image_path, 200)
+                    if img:
+                        parts.append(img)
+            if parts:
+                st.markdown("\n".join(parts), unsafe_allow_html=True)
             else:
                 st.info("No results found.")
     else:
         place_term = st.text_input("Enter place name")
         if st.button("Search by Place"):
-            results = search_by_place_name(place_term)
-            if results:
-                st.subheader(f"Clients at {place_term}:")
-                for i, (client_name, car_number, image_path) in enumerate(results, 1):
-                    st.markdown(f"**{i}. {client_name} — {car_number}**")
-                    if image_path and os.path.exists(image_path):
-                        st.image(image_path, width=150)
+            existing_images = list_images()
+            rows = list(search_by_place_name(place_term))
+            parts = []
+            for i, (client_name, car_number, image_path) in enumerate(rows, 1):
+                if i == 1:
+                    parts.append(
+                        f"<h3>Clients at {html.escape(place_term)}:</h3>")
+                parts.append(
+                    f"<p><strong>{i}. {html.escape(client_name)} — {html.escape(car_number)}</strong></p>")
+                if image_path and os.path.basename(image_path) in existing_images:
+                    img = thumbnail_img(image_path, 150)
+                    if img:
+                        parts.append(img)
+            if parts:
+                st.markdown("\n".join(parts), unsafe_allow_html=True)
             else:
                 st.info("No clients found at this place.")
 
@@ -290,10 +649,10 @@ if st.session_state.logged_in:
         if "reset_form" not in st.session_state:
             st.session_state.reset_form = False
         if "file_key" not in st.session_state:
-            st.session_state.file_key = str(time.time())
+            st.session_state.file_key = uuid.uuid4().hex[:12]
 
         if st.session_state.reset_form:
-            st.session_state.file_key = str(time.time())
+            st.session_state.file_key = uuid.uuid4().hex[:12]
             st.session_state.reset_form = False
 
         client_name = st.text_input("Client Name")
@@ -317,15 +676,14 @@ if st.session_state.logged_in:
         if st.button("Add Entry"):
             if not client_name or not car_number or not final_place:
                 st.warning("All fields (except image) are required.")
-            elif object_exists(client_name, car_number):
-                st.warning(
-                    "This client already has that car number registered.")
             else:
-                add_place(final_place)
-                place_id = get_place_id_by_name(final_place)
-                add_object(client_name, car_number, place_id, image)
-                st.success(f"Entry for {client_name} ({car_number}) added.")
-                st.session_state.reset_form = True
+                if add_entry(client_name, car_number, final_place, image) is None:
+                    st.warning(
+                        "This client already has that car number registered.")
+                else:
+                    st.success(
+                        f"Entry for {client_name} ({car_number}) added.")
+                    st.session_state.reset_form = True
 
     # ---------- TAB 3: MANAGE PLACES ----------
     with tab3:
@@ -341,45 +699,99 @@ if st.session_state.logged_in:
                 st.warning("Place name cannot be empty.")
 
         st.subheader("Current Places")
-        all_places = get_places()
-        for place_id, name in all_places:
-            col1, col2 = st.columns([5, 1])
-            with col1:
-                st.markdown(f"- {name}")
-            with col2:
-                if st.button("Delete", key=f"del_place_{place_id}"):
-                    success = delete_place(place_id)
-                    if success:
-                        st.success(f"Deleted place: {name}")
-                        st.rerun()
-                    else:
-                        st.error(f"Can't delete '{name}'. It's in use.")
+        if "places_editor_version" not in st.session_state:
+            st.session_state.places_editor_version = 0
+        places_editor_key = f"places_editor_{st.session_state.places_editor_version}"
+
+        # One data_editor instead of a Delete button per place
+        places_df = pd.DataFrame(get_places(), columns=["id", "name"])
+        places_df["delete"] = False
+        st.data_editor(
+            places_df, key=places_editor_key, hide_index=True,
+            disabled=["name"],
+            column_config={
+                "id": None,
+                "name": "Place",
+                "delete": st.column_config.CheckboxColumn("Delete"),
+            })
+
+        if st.button("Delete Selected Places"):
+            edited_rows = st.session_state[places_editor_key]["edited_rows"]
+            selected = {int(places_df.iloc[row]["id"]): places_df.iloc[row]["name"]
+                        for row, changes in edited_rows.items()
+                        if changes.get("delete")}
+            deleted = delete_places(list(selected))
+            in_use = [name for place_id, name in selected.items()
+                      if place_id not in deleted]
+            st.session_state.places_editor_version += 1
+            if not in_use:
+                st.rerun()
+            for name in in_use:
+                st.error(f"Can't delete '{name}'. It's in use.")
 
     # ---------- TAB 4: MANAGE ENTRIES ----------
     with tab4:
         st.header("✏️ Manage Entries")
-        all_entries = get_all_objects()
-
-        for entry_id, client_name, car_number, place in all_entries:
-            col1, col2, col3 = st.columns([4, 3, 2])
-            with col1:
-                st.markdown(f"**{client_name} — {car_number}**  ({place})")
-            with col2:
-                new_number = st.text_input(
-                    "New Number", key=f"edit_num_{entry_id}")
-                if st.button("Update", key=f"update_{entry_id}"):
-                    if new_number.strip():
-                        update_car_number(entry_id, new_number.strip())
-                        st.success("Car number updated.")
-                        st.rerun()
-                    else:
-                        st.warning("Car number cannot be empty.")
-            with col3:
-                if st.button("❌ Delete", key=f"delete_{entry_id}"):
-                    delete_object(entry_id)
-                    st.success("Entry deleted.")
+        if "entries_editor_version" not in st.session_state:
+            st.session_state.entries_editor_version = 0
+        if "page_cursors" not in st.session_state:
+            st.session_state.page_cursors = [None]
+        entries_editor_key = f"entries_editor_{st.session_state.entries_editor_version}"
+
+        # One data_editor instead of an input and two buttons per entry
+        page_rows, has_next = get_objects_page(
+            st.session_state.page_cursors[-1])
+        entries_df = pd.DataFrame(
+            page_rows, columns=["id", "client_name", "car_number", "place"])
+        entries_df["delete"] = False
+        st.data_editor(
+            entries_df, key=entries_editor_key, hide_index=True,
+            disabled=["client_name", "place"],
+            column_config={
+                "id": None,
+                "client_name": "Client",
+                "car_number": "Car Number",
+                "place": "Place",
+                "delete": st.column_config.CheckboxColumn("❌ Delete"),
+            })
+
+        if st.button("Save Changes"):
+            edited_rows = st.session_state[entries_editor_key]["edited_rows"]
+            updates = []
+            deleted_ids = []
+            for row, changes in edited_rows.items():
+                entry_id = int(entries_df.iloc[row]["id"])
+                if changes.get("delete"):
+                    deleted_ids.append(entry_id)
+                elif "car_number" in changes:
+                    updates.append(
+                        ((changes["car_number"] or "").strip(), entry_id))
+
+            if any(not new_number for new_number, _ in updates):
+                st.warning("Car number cannot be empty.")
+            else:
+                try:
+                    save_entry_changes(updates, deleted_ids)
+                except sqlite3.IntegrityError:
+                    st.error(
+                        "This client already has that car number registered.")
+                else:
+                    st.session_state.entries_editor_version += 1
                     st.rerun()
 
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(st.session_state.page_cursors) > 1 and st.button("◀ Previous"):
+                st.session_state.page_cursors.pop()
+                st.session_state.entries_editor_version += 1
+                st.rerun()
+        with col2:
+            if has_next and st.button("Next ▶"):
+                last_id, last_client = page_rows[-1][0], page_rows[-1][1]
+                st.session_state.page_cursors.append((last_client, last_id))
+                st.session_state.entries_editor_version += 1
+                st.rerun()
+
     # ---------- TAB 5: CHANGE PASSWORD ----------
     with tab5:
         st.header("\U0001F511 Change Admin Password")